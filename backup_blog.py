@@ -1,25 +1,65 @@
 
 import os
+import re
 import requests
-from bs4 import BeautifulSoup
-from markdownify import markdownify as md
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession, DO_NOT_CACHE, NEVER_EXPIRE
+from urllib3.util.retry import Retry
+from selectolax.lexbor import LexborHTMLParser
+from markdownify import MarkdownConverter
 import time
 import argparse
 from urllib.parse import urlparse, unquote
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+
+# Shared session so keep-alive connections are reused across posts and images.
+# Responses are also cached on disk so re-runs skip unchanged pages.
+SESSION = CachedSession("tistory_cache.sqlite", expire_after=timedelta(days=7), allowable_codes=(200,))
+_adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+SESSION.headers.update({
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36",
+    "Referer": "https://kicho.tistory.com/"
+})
+
+# Post workers mostly wait on the network, so run a few per core; the cap
+# keeps posts plus IMAGE_EXECUTOR within the session's 64 pooled connections
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 4) * 4)
+
+# Images get their own pool so a post's downloads run concurrently instead of
+# one after another inside that post's worker
+IMAGE_EXECUTOR = ThreadPoolExecutor(max_workers=32)
+
+# Shared Markdown converter (ATX is standard #). Reusing it keeps its
+# per-tag handler cache warm, and lxml parses the content subtree faster
+# than html.parser.
+_CONV = MarkdownConverter(heading_style="atx", bs4_options="lxml")
+
+# Post URLs in sitemap.xml, e.g. <loc>https://kicho.tistory.com/123</loc>
+_SITEMAP_POST_RE = re.compile(r'<loc>\s*https?://kicho\.tistory\.com/(\d+)\s*</loc>')
 
 def sanitize_filename(name):
     """Sanitize string to be safe for filenames."""
     return "".join([c for c in name if c.isalpha() or c.isdigit() or c in (' ', '-', '_')]).rstrip()
 
+@lru_cache(maxsize=None)
+def _ensure_dir(path):
+    """os.makedirs once per path; the shared output directories never change."""
+    os.makedirs(path, exist_ok=True)
+
 def download_image(url, save_dir):
     if not url.startswith(('http:', 'https:')):
         return url
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36",
-            "Referer": "https://kicho.tistory.com/"
-        }
-        response = requests.get(url, stream=True, headers=headers)
+        # Image URLs are content-addressed on the CDN, so cached copies never go stale
+        response = SESSION.get(url, stream=True, expire_after=NEVER_EXPIRE)
         response.raise_for_status()
         
         # Extract filename from URL
@@ -59,13 +99,26 @@ def download_image(url, save_dir):
 
         filepath = os.path.join(save_dir, filename)
         
-        if os.path.exists(filepath):
+        try:
+            # 'x' mode claims the name atomically, since a post's images are
+            # downloaded concurrently
+            f = open(filepath, 'xb')
+        except FileExistsError:
              # Try not to overwrite valid images, but also don't complicate too much
+             # Release the unread stream so the pooled connection can be reused
+             response.close()
              return filename
 
-        with open(filepath, 'wb') as f:
-            for chunk in response.iter_content(1024):
-                f.write(chunk)
+        try:
+            with f:
+                # Copy in 64 KiB blocks; iter_content undoes gzip/deflate, and
+                # unlike response.raw also works on bodies replayed from the cache
+                for chunk in response.iter_content(65536):
+                    f.write(chunk)
+        except BaseException:
+            # Don't leave a partial file that later runs would take as downloaded
+            os.remove(filepath)
+            raise
         return filename
     except Exception as e:
         print(f"    [!] Error downloading image {url}: {e}")
@@ -74,7 +127,7 @@ def download_image(url, save_dir):
 def backup_post(post_id, base_dir="backup"):
     url = f"https://kicho.tistory.com/{post_id}"
     try:
-        response = requests.get(url)
+        response = SESSION.get(url)
         if response.status_code == 404:
             # print(f"[-] Post {post_id} not found.")
             return False
@@ -83,22 +136,22 @@ def backup_post(post_id, base_dir="backup"):
         print(f"[!] Network error for {url}: {e}")
         return False
 
-    soup = BeautifulSoup(response.text, 'html.parser')
+    tree = LexborHTMLParser(response.content)
 
     # Selectors based on analysis
-    title_elem = soup.select_one('.title, h3.title, .entry-title')
-    date_elem = soup.select_one('.date, .time, .published')
-    category_elem = soup.select_one('.category, .entry-category')
-    content_elem = soup.select_one('.article, .entry-content, .tt_article_useless_p_margin')
+    title_elem = tree.css_first('.title, h3.title, .entry-title')
+    date_elem = tree.css_first('.date, .time, .published')
+    category_elem = tree.css_first('.category, .entry-category')
+    content_elem = tree.css_first('.article, .entry-content, .tt_article_useless_p_margin')
 
     if not title_elem:
         # Might be a protected post or redirect
         # print(f"[-] Post {post_id} skipped (no title found).")
         return False
 
-    title = title_elem.get_text(strip=True)
-    date = date_elem.get_text(strip=True) if date_elem else ""
-    category = category_elem.get_text(strip=True) if category_elem else "Uncategorized"
+    title = title_elem.text(strip=True)
+    date = date_elem.text(strip=True) if date_elem else ""
+    category = category_elem.text(strip=True) if category_elem else "Uncategorized"
     
     # Clean category (remove brackets usually format like 'Category (5)')
     if '(' in category:
@@ -109,25 +162,28 @@ def backup_post(post_id, base_dir="backup"):
     # Prepare directories
     post_dir = os.path.join(base_dir, "posts")
     img_dir = os.path.join(base_dir, "images", str(post_id))
-    os.makedirs(post_dir, exist_ok=True)
-    os.makedirs(img_dir, exist_ok=True)
+    _ensure_dir(post_dir)
+    _ensure_dir(os.path.join(base_dir, "images"))
+    try:
+        os.mkdir(img_dir)
+    except FileExistsError:
+        pass
 
     # Process Images
     if content_elem:
-        for img in content_elem.find_all('img'):
-            src = img.get('src')
-            if src:
-                # Tistory often uses cfile*.uf.tistory.com...
-                filename = download_image(src, img_dir)
-                # Replace src with local relative path
-                img['src'] = f"../images/{post_id}/{filename}"
-                # Remove srcset to force local usage
-                if img.has_attr('srcset'):
-                    del img['srcset']
+        # Tistory often uses cfile*.uf.tistory.com...
+        # Read the srcs here; the pool only gets strings, never the tree
+        images = [(img, img.attributes['src']) for img in content_elem.css('img') if img.attributes.get('src')]
+        filenames = IMAGE_EXECUTOR.map(lambda item: download_image(item[1], img_dir), images)
+        for (img, _), filename in zip(images, filenames):
+            # Replace src with local relative path
+            img.attrs['src'] = f"../images/{post_id}/{filename}"
+            # Remove srcset to force local usage
+            if 'srcset' in img.attrs:
+                del img.attrs['srcset']
         
         # Convert to Markdown
-        # Determine heading style (ATX is standard #)
-        content_md = md(str(content_elem), heading_style="atx")
+        content_md = _CONV.convert(content_elem.html)
     else:
         content_md = ""
 
@@ -144,24 +200,67 @@ url: "{url}"
     
     filename = f"{post_id}.md"
     filepath = os.path.join(post_dir, filename)
-    with open(filepath, 'w', encoding='utf-8') as f:
-        f.write(frontmatter + content_md)
+    # Two writes into a 1 MiB buffer instead of concatenating a copy of the body
+    with open(filepath, 'w', encoding='utf-8', buffering=1 << 20) as f:
+        f.write(frontmatter)
+        f.write(content_md)
 
     return True
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
+def get_sitemap_post_ids():
+    """Returns the numeric post ids listed in the blog's sitemap.xml, or None if unavailable."""
+    url = "https://kicho.tistory.com/sitemap.xml"
+    try:
+        # Always fetched fresh so newly published posts show up on re-runs
+        response = SESSION.get(url, expire_after=DO_NOT_CACHE)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"[!] Could not fetch sitemap {url}: {e}")
+        return None
+
+    post_ids = {int(pid) for pid in _SITEMAP_POST_RE.findall(response.text)}
+    return post_ids or None
+
+def post_exists(post_id):
+    """Cheap HEAD check; anything but a 404 is left for backup_post to handle."""
+    try:
+        response = SESSION.head(f"https://kicho.tistory.com/{post_id}", allow_redirects=True)
+    except requests.exceptions.RequestException:
+        return True
+    return response.status_code != 404
+
+def probe_post_ids(post_ids):
+    """Filters out missing posts with concurrent HEAD requests."""
+    with ThreadPoolExecutor(max_workers=64) as executor:
+        return [pid for pid, exists in zip(post_ids, executor.map(post_exists, post_ids)) if exists]
 
 def main():
     parser = argparse.ArgumentParser(description="Backup Tistory Blog")
     parser.add_argument("--start", type=int, default=1, help="Start ID")
     parser.add_argument("--end", type=int, default=700, help="End ID")
     parser.add_argument("--output", default="backup", help="Output directory")
-    parser.add_argument("--workers", type=int, default=10, help="Number of worker threads")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Number of post worker threads (default: %(default)s, from 4 per CPU "
+                             "capped at 32; fetching is I/O-bound, so more threads than cores "
+                             "keep requests in flight while others wait on the network)")
+    parser.add_argument("--no-cache", action="store_true", help="Clear the on-disk HTTP cache before fetching")
+    parser.add_argument("--probe", action="store_true", help="Find posts by probing every ID instead of reading sitemap.xml")
     args = parser.parse_args()
 
+    if args.no_cache:
+        SESSION.cache.clear()
+
     print(f"Starting backup from ID {args.start} to {args.end} with {args.workers} workers...")
     
-    post_ids = range(args.start, args.end + 1)
+    # Only fetch ids that exist: take them from the sitemap, or fall back to
+    # HEAD-probing the whole range so 404s cost no body download
+    sitemap_ids = None if args.probe else get_sitemap_post_ids()
+    if sitemap_ids:
+        post_ids = sorted(pid for pid in sitemap_ids if args.start <= pid <= args.end)
+        print(f"Sitemap lists {len(post_ids)} posts in range.")
+    else:
+        post_ids = probe_post_ids(range(args.start, args.end + 1))
+        print(f"Probe found {len(post_ids)} candidate posts in range.")
     found_count = 0
     
     with ThreadPoolExecutor(max_workers=args.workers) as executor:
@@ -1,14 +1,55 @@
 import os
-import requests
-import json
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession, DO_NOT_CACHE, NEVER_EXPIRE
+from urllib3.util.retry import Retry
+import orjson
 import re
-from bs4 import BeautifulSoup
-from markdownify import markdownify as md
+from selectolax.lexbor import LexborHTMLParser
+from markdownify import MarkdownConverter
 import argparse
 import html
 from urllib.parse import urlparse, unquote
+from datetime import timedelta
 from concurrent.futures import ThreadPoolExecutor, as_completed
-import time
+from functools import lru_cache
+import hashlib
+import shutil
+import threading
+
+# Shared session so keep-alive connections are reused across posts and images.
+# Responses are also cached on disk so re-runs skip unchanged pages.
+SESSION = CachedSession("naver_cache.sqlite", expire_after=timedelta(days=7), allowable_codes=(200,))
+_adapter = HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+)
+SESSION.mount("https://", _adapter)
+SESSION.mount("http://", _adapter)
+SESSION.headers.update({
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36",
+    "Referer": "https://blog.naver.com/"
+})
+
+# Post workers mostly wait on the network, so run a few per core; the cap
+# keeps posts plus IMAGE_EXECUTOR within the session's 64 pooled connections
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 4) * 4)
+
+# Images get their own pool so a post's downloads run concurrently instead of
+# one after another inside that post's worker
+IMAGE_EXECUTOR = ThreadPoolExecutor(max_workers=32)
+
+# Shared Markdown converter (ATX is standard #). Reusing it keeps its
+# per-tag handler cache warm, and lxml parses the content subtree faster
+# than html.parser.
+_CONV = MarkdownConverter(heading_style="atx", bs4_options="lxml")
+
+# Page size requested from the post list API
+POSTS_PER_PAGE = 30
+
+# Source URL -> path of the downloaded file, shared by all workers
+_URL_TO_PATH = {}
+_URL_LOCK = threading.Lock()
 
 def sanitize_filename(name):
     """Sanitize string to be safe for filenames."""
@@ -16,26 +57,42 @@ def sanitize_filename(name):
         return "untitled"
     return "".join([c for c in name if c.isalpha() or c.isdigit() or c in (' ', '-', '_')]).rstrip()
 
+def _link_cached_image(cached_path, save_dir):
+    """Places an already downloaded image in save_dir without fetching it again."""
+    filename = os.path.basename(cached_path)
+    filepath = os.path.join(save_dir, filename)
+    try:
+        os.link(cached_path, filepath)
+    except FileExistsError:
+        # Already placed, e.g. by another of this post's images
+        pass
+    except OSError:
+        shutil.copyfile(cached_path, filepath)
+    return filename
+
+@lru_cache(maxsize=None)
+def _ensure_dir(path):
+    """os.makedirs once per path; the shared output directories never change."""
+    os.makedirs(path, exist_ok=True)
+
 def download_image(url, save_dir):
     if not url.startswith(('http:', 'https:')):
         return url
+
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36",
-            "Referer": "https://blog.naver.com/"
-        }
-        response = requests.get(url, stream=True, headers=headers)
+        # Banner/profile images recur across posts; fetch each URL only once
+        with _URL_LOCK:
+            cached_path = _URL_TO_PATH.get(url)
+        if cached_path:
+            return _link_cached_image(cached_path, save_dir)
+
+        # Image URLs are content-addressed on the CDN, so cached copies never go stale
+        response = SESSION.get(url, stream=True, expire_after=NEVER_EXPIRE)
         response.raise_for_status()
         
-        # Extract filename from URL
+        # Extension from the URL path, falling back to the Content-Type header
         parsed = urlparse(url)
-        filename = os.path.basename(unquote(parsed.path))
-        if not filename or len(filename) > 50:
-             # Naver images often have long cryptic names, or no extension in path
-            filename = f"image_{int(time.time()*1000)}"
-
-        # Handle extension using Content-Type header
-        name, ext = os.path.splitext(filename)
+        ext = os.path.splitext(os.path.basename(unquote(parsed.path)))[1]
         if not ext or len(ext) > 5: # basic sanity check
             content_type = response.headers.get('Content-Type', '').lower()
             if 'image/jpeg' in content_type or 'image/jpg' in content_type:
@@ -48,83 +105,106 @@ def download_image(url, save_dir):
                 ext = '.webp'
             else:
                 ext = '.jpg'
-            
-            filename = f"{name}{ext}"
 
-        filepath = os.path.join(save_dir, filename)
-        
-        # Avoid duplicate downloads if possible (simple check)
-        counter = 1
-        base_name = name
-        while os.path.exists(filepath):
-             filename = f"{base_name}_{counter}{ext}"
-             filepath = os.path.join(save_dir, filename)
-             counter += 1
-
-        with open(filepath, 'wb') as f:
-            for chunk in response.iter_content(1024):
-                f.write(chunk)
+        # Stream to a temporary file named after this thread (it downloads one
+        # image at a time), then rename it to its content hash so identical
+        # images share one file per post
+        digest = hashlib.blake2b(digest_size=8)
+        tmp_path = os.path.join(save_dir, f".{threading.get_ident()}.part")
+        try:
+            with open(tmp_path, 'wb') as f:
+                # 64 KiB chunks; each one is hashed as well, so copyfileobj doesn't fit
+                for chunk in response.iter_content(65536):
+                    digest.update(chunk)
+                    f.write(chunk)
+            filename = f"{digest.hexdigest()}{ext}"
+            filepath = os.path.join(save_dir, filename)
+            os.replace(tmp_path, filepath)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with _URL_LOCK:
+            _URL_TO_PATH[url] = filepath
         return filename
     except Exception as e:
         print(f"    [!] Error downloading image {url}: {e}")
         return url 
 
+def fetch_post_list_page(blog_id, page):
+    """
+    Fetches one page of the post list.
+    Returns the raw 'postList' entries ([] past the last page), or None on error.
+    """
+    base_url = "https://blog.naver.com/PostTitleListAsync.naver"
+    params = {
+        'blogId': blog_id,
+        'viewdate': '',
+        'currentPage': page,
+        'categoryNo': '', 
+        'parentCategoryNo': '',
+        'countPerPage': POSTS_PER_PAGE
+    }
+    
+    try:
+        # Always fetched fresh so newly published posts show up on re-runs
+        resp = SESSION.get(base_url, params=params, expire_after=DO_NOT_CACHE)
+        resp.raise_for_status()
+        # Naver returns invalid JSON with \' escapes sometimes; fix them on the
+        # raw bytes so the body is never decoded to str first
+        data = orjson.loads(resp.content.replace(b"\\'", b"'"))
+    except Exception as e:
+        print(f"[!] Error fetching post list page {page}: {e}")
+        return None
+
+    return data.get('postList') or []
+
 def get_post_list(blog_id, max_pages=100):
     """
     Fetches list of posts using Naver's async API.
     Returns a list of dicts with 'logNo', 'title', 'addDate'.
     """
     posts = []
-    base_url = "https://blog.naver.com/PostTitleListAsync.naver"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36"
-    }
+    seen = set()
 
     print(f"[*] Fetching post list for {blog_id}...")
-    
-    for page in range(1, max_pages + 1):
-        params = {
-            'blogId': blog_id,
-            'viewdate': '',
-            'currentPage': page,
-            'categoryNo': '', 
-            'parentCategoryNo': '',
-            'countPerPage': 30
-        }
-        
-        try:
-            resp = requests.get(base_url, params=params, headers=headers)
-            resp.raise_for_status()
-            # Naver returns invalid JSON with \' escapes sometimes
-            cleaned_text = resp.text.replace("\\'", "'")
-            data = json.loads(cleaned_text)
-            
-            if 'postList' not in data:
-                break
-                
-            current_posts = data['postList']
-            if not current_posts:
-                break
-                
-            for post in current_posts:
-                # Naver titles are URL encoded sometimes
-                title = unquote(post['title']).replace('+', ' ')
-                # Also unescape HTML entities
-                title = html.unescape(title)
-                posts.append({
-                    'logNo': post['logNo'],
-                    'title': title,
-                    'date': post['addDate']
-                })
-            
-            print(f"    Page {page}: Found {len(current_posts)} posts (Total so far: {len(posts)})")
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        # Probe pages 1, 2, 4, 8, ... concurrently; the first short or empty
+        # one bounds the list
+        probe_pages = [p for p in (1, 2, 4, 8, 16, 32, 64) if p <= max_pages]
+        pages = dict(zip(probe_pages, executor.map(lambda p: fetch_post_list_page(blog_id, p), probe_pages)))
+        last_page = next((p for p in probe_pages if pages[p] is None or len(pages[p]) < POSTS_PER_PAGE), max_pages)
+
+        # Then fetch every remaining page up to that bound concurrently
+        missing = [p for p in range(1, last_page + 1) if p not in pages]
+        pages.update(zip(missing, executor.map(lambda p: fetch_post_list_page(blog_id, p), missing)))
+
+    # Collate in page order, stopping where the serial loop would have
+    for page in range(1, last_page + 1):
+        current_posts = pages[page]
+        if not current_posts:
+            break
             
-            # Helper logic to stop if we think we reached the end (naive check)
-            if len(current_posts) < 30:
-                break
-                
-        except Exception as e:
-            print(f"[!] Error fetching post list page {page}: {e}")
+        for post in current_posts:
+            if post['logNo'] in seen:
+                continue
+            seen.add(post['logNo'])
+            # Naver titles are URL encoded sometimes
+            title = unquote(post['title']).replace('+', ' ')
+            # Also unescape HTML entities
+            title = html.unescape(title)
+            posts.append({
+                'logNo': post['logNo'],
+                'title': title,
+                'date': post['addDate']
+            })
+        
+        print(f"    Page {page}: Found {len(current_posts)} posts (Total so far: {len(posts)})")
+        
+        # Helper logic to stop if we think we reached the end (naive check)
+        if len(current_posts) < POSTS_PER_PAGE:
             break
             
     return posts
@@ -137,24 +217,21 @@ def backup_post(blog_id, post_info, base_dir="backup_naver"):
     url = f"https://blog.naver.com/PostView.naver?blogId={blog_id}&logNo={log_no}"
     
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36"
-        }
-        response = requests.get(url, headers=headers)
+        response = SESSION.get(url)
         response.raise_for_status()
     except Exception as e:
         print(f"[!] Network error for {url}: {e}")
         return False
 
-    soup = BeautifulSoup(response.text, 'html.parser')
+    tree = LexborHTMLParser(response.content)
 
     # Main content container
     # Naver SmartEditor 2.0 uses #post-view...
     # Naver SmartEditor One uses .se-main-container
     
-    content_elem = soup.select_one('.se-main-container')
+    content_elem = tree.css_first('.se-main-container')
     if not content_elem:
-        content_elem = soup.find(id=f"post-view{log_no}")
+        content_elem = tree.css_first(f"#post-view{log_no}")
         
     if not content_elem:
         print(f"[-] Content not found for {log_no} ({title})")
@@ -165,38 +242,46 @@ def backup_post(blog_id, post_info, base_dir="backup_naver"):
     # Prepare directories
     post_dir = os.path.join(base_dir, "posts")
     img_dir = os.path.join(base_dir, "images", str(log_no))
-    os.makedirs(post_dir, exist_ok=True)
-    os.makedirs(img_dir, exist_ok=True)
+    _ensure_dir(post_dir)
+    _ensure_dir(os.path.join(base_dir, "images"))
+    try:
+        os.mkdir(img_dir)
+    except FileExistsError:
+        pass
 
     # Process Images
     if content_elem:
-        # Download images
-        for img in content_elem.find_all('img'):
-            src = img.get('src')
+        # Collect images to download
+        images = []
+        for img in content_elem.css('img'):
+            src = img.attributes.get('src')
             # Naver generic spacer images or icons
             if not src or 'blank' in src or 'pixel' in src:
                 continue
                 
             # SmartEditor lazy loading uses data-src or data-lazy-src
-            if img.get('data-lazy-src'):
-                src = img.get('data-lazy-src')
-            elif img.get('data-src'):
-                src = img.get('data-src')
+            if img.attributes.get('data-lazy-src'):
+                src = img.attributes['data-lazy-src']
+            elif img.attributes.get('data-src'):
+                src = img.attributes['data-src']
 
             if src:
                 # Do NOT remove query parameters as Naver images require them for access
                 # and data-lazy-src usually points to a high-res version with correct params.
+                images.append((img, src))
 
-                filename = download_image(src, img_dir)
-                # Replace src with local relative path
-                img['src'] = f"../images/{log_no}/{filename}"
-                # Remove srcset/data-src to force local usage
-                if img.has_attr('srcset'): del img['srcset']
-                if img.has_attr('data-src'): del img['data-src']
-                if img.has_attr('data-lazy-src'): del img['data-lazy-src']
+        # Download images concurrently
+        filenames = IMAGE_EXECUTOR.map(lambda item: download_image(item[1], img_dir), images)
+        for (img, _), filename in zip(images, filenames):
+            # Replace src with local relative path
+            img.attrs['src'] = f"../images/{log_no}/{filename}"
+            # Remove srcset/data-src to force local usage
+            if 'srcset' in img.attrs: del img.attrs['srcset']
+            if 'data-src' in img.attrs: del img.attrs['data-src']
+            if 'data-lazy-src' in img.attrs: del img.attrs['data-lazy-src']
         
         # Convert to Markdown
-        content_md = md(str(content_elem), heading_style="atx")
+        content_md = _CONV.convert(content_elem.html)
     else:
         content_md = ""
 
@@ -212,8 +297,10 @@ url: "{url}"
     
     filename = f"{log_no}.md"
     filepath = os.path.join(post_dir, filename)
-    with open(filepath, 'w', encoding='utf-8') as f:
-        f.write(frontmatter + content_md)
+    # Two writes into a 1 MiB buffer instead of concatenating a copy of the body
+    with open(filepath, 'w', encoding='utf-8', buffering=1 << 20) as f:
+        f.write(frontmatter)
+        f.write(content_md)
 
     return True
 
@@ -222,9 +309,16 @@ def main():
     parser.add_argument("--blog_id", default="kicho_57", help="Naver Blog ID")
     parser.add_argument("--output", default="backup_naver", help="Output directory")
     parser.add_argument("--limit", type=int, default=0, help="Limit number of posts to backup (0 for all)")
-    parser.add_argument("--workers", type=int, default=5, help="Number of worker threads")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Number of post worker threads (default: %(default)s, from 4 per CPU "
+                             "capped at 32; fetching is I/O-bound, so more threads than cores "
+                             "keep requests in flight while others wait on the network)")
+    parser.add_argument("--no-cache", action="store_true", help="Clear the on-disk HTTP cache before fetching")
     args = parser.parse_args()
 
+    if args.no_cache:
+        SESSION.cache.clear()
+
     # Get list of posts
     posts = get_post_list(args.blog_id)
     print(f"Total posts found: {len(posts)}")
@@ -1,73 +1,88 @@
 
 import os
-import glob
-import markdown
+import mistune
 import yaml
 import re
+import pickle
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from html import escape
+from lxml.etree import xmlfile, CDATA
 
 # Configuration
 BACKUP_DIR = "backup/posts"
 IMAGE_BASE_URL = "http://localhost:8000" # Local server for import
 OUTPUT_FILE = "tistory_backup.xml"
+CACHE_FILE = ".wxr_cache.pkl"
+CACHE_VERSION = 3 # Bump when parse_markdown_file output changes
 
-def create_wxr_header():
+# WXR namespaces, declared once on <rss>
+NSMAP = {
+    'excerpt': "http://wordpress.org/export/1.2/excerpt/",
+    'content': "http://purl.org/rss/1.0/modules/content/",
+    'wfw': "http://wellformedweb.org/CommentAPI/",
+    'dc': "http://purl.org/dc/elements/1.1/",
+    'wp': "http://wordpress.org/export/1.2/",
+}
+
+# Markdown renderer; escape=False keeps raw HTML from the backups intact
+_MD = mistune.create_markdown(escape=False, plugins=['table', 'strikethrough', 'url'])
+
+# Frontmatter "key: value" lines; outer "..." or '...' around the value is dropped
+_FM_RE = re.compile(rb'''^[ \t]*(title|date|category|id|url)[ \t]*:[ \t]*(?:"(.*)"|'(.*)'|(.*?))[ \t]*$''', re.MULTILINE)
+
+# Characters XML 1.0 forbids (e.g. \x0b pasted from Word); lxml refuses to write them
+_XML_INVALID_RE = re.compile('[^\t\n\r\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]')
+
+# Relative image paths in rendered HTML, e.g. src="../images/ID/foo.jpg"
+_SRC_RE = re.compile(r'src="(\.\./[^"]+)"')
+
+def qname(tag):
+    """Expands a prefixed name like 'wp:post_id' to lxml's '{uri}post_id' form."""
+    prefix, sep, local = tag.partition(':')
+    return f"{{{NSMAP[prefix]}}}{local}" if sep else tag
+
+def write_element(xf, tag, text='', cdata=False, attrib=None):
+    """Writes a leaf element; lxml escapes the text, or it is wrapped in CDATA."""
+    text = _XML_INVALID_RE.sub('', text)
+    if attrib:
+        attrib = {k: _XML_INVALID_RE.sub('', v) for k, v in attrib.items()}
+    with xf.element(qname(tag), attrib):
+        if cdata and ']]>' not in text:
+            xf.write(CDATA(text))
+        elif text:
+            xf.write(text)
+    xf.write('\n')
+
+def write_wxr_header(xf):
     now = datetime.now().strftime("%Y-%m-%d %H:%M")
-    return f"""<?xml version="1.0" encoding="UTF-8" ?>
-<rss version="2.0"
-	xmlns:excerpt="http://wordpress.org/export/1.2/excerpt/"
-	xmlns:content="http://purl.org/rss/1.0/modules/content/"
-	xmlns:wfw="http://wellformedweb.org/CommentAPI/"
-	xmlns:dc="http://purl.org/dc/elements/1.1/"
-	xmlns:wp="http://wordpress.org/export/1.2/"
->
-<channel>
-	<title>Tistory Backup</title>
-	<link>http://localhost</link>
-	<description>Backup of Kicho Tistory</description>
-	<pubDate>{now}</pubDate>
-	<language>ko-KR</language>
-	<wp:wxr_version>1.2</wp:wxr_version>
-	<wp:base_site_url>http://localhost</wp:base_site_url>
-	<wp:base_blog_url>http://localhost</wp:base_blog_url>
-
-"""
-
-def create_wxr_footer():
-    return """
-</channel>
-</rss>
-"""
+    write_element(xf, 'title', 'Tistory Backup')
+    write_element(xf, 'link', 'http://localhost')
+    write_element(xf, 'description', 'Backup of Kicho Tistory')
+    write_element(xf, 'pubDate', now)
+    write_element(xf, 'language', 'ko-KR')
+    write_element(xf, 'wp:wxr_version', '1.2')
+    write_element(xf, 'wp:base_site_url', 'http://localhost')
+    write_element(xf, 'wp:base_blog_url', 'http://localhost')
 
 def parse_markdown_file(filepath):
-    with open(filepath, 'r', encoding='utf-8') as f:
-        content = f.read()
+    with open(filepath, 'rb') as f:
+        # Backups written in text mode on Windows have CRLF line endings
+        content = f.read().replace(b'\r\n', b'\n')
 
     # Split Frontmatter
-    parts = content.split('---', 2)
+    parts = content.split(b'---', 2)
     if len(parts) < 3:
         return None
     
-    frontmatter_raw = parts[1].strip()
-    markdown_body = parts[2]
+    frontmatter_raw = parts[1]
+    markdown_body = parts[2].decode('utf-8')
     
-    # Manual Frontmatter Parsing (Robust to invalid YAML quotes)
-    meta = {}
-    for line in frontmatter_raw.split('\n'):
-        if ':' in line:
-            key, val = line.split(':', 1)
-            key = key.strip()
-            val = val.strip()
-            # Remove outer quotes if likely wrapping
-            if len(val) >= 2 and val.startswith('"') and val.endswith('"'):
-                val = val[1:-1]
-            elif len(val) >= 2 and val.startswith("'") and val.endswith("'"):
-                val = val[1:-1]
-            meta[key] = val
+    # Frontmatter in one regex sweep (robust to invalid YAML quotes); the
+    # value is whichever of the quoted/unquoted groups matched
+    meta = {m[1].decode(): m[m.lastindex].decode('utf-8') for m in _FM_RE.finditer(frontmatter_raw)}
 
     # Convert Markdown to HTML
-    html_body = markdown.markdown(markdown_body)
+    html_body = _MD(markdown_body)
 
     # Fix relative image paths to localhost URL
     # Replace src="../images/ID/foo.jpg" with src="http://localhost:8000/images/ID/foo.jpg"
@@ -78,7 +93,7 @@ def parse_markdown_file(filepath):
         clean_path = path.replace('../', '')
         return f'src="{IMAGE_BASE_URL}/{clean_path}"'
         
-    html_body = re.sub(r'src="(\.\./[^"]+)"', replacer, html_body)
+    html_body = _SRC_RE.sub(replacer, html_body)
 
     return {
         "title": meta.get('title', 'Untitled'),
@@ -89,6 +104,27 @@ def parse_markdown_file(filepath):
         "original_url": meta.get('url', '')
     }
 
+def iter_md(directory):
+    """Yields the path of each .md file, using scandir's cached entry type."""
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.endswith(".md") and entry.is_file():
+                yield entry.path
+
+def load_cache():
+    """Loads {filepath: (mtime, size, post)} from CACHE_FILE, or {} if unusable."""
+    try:
+        with open(CACHE_FILE, 'rb') as f:
+            stamp, cache = pickle.load(f)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return {}
+    # Cached HTML has IMAGE_BASE_URL baked in, so a config change invalidates it too
+    return cache if stamp == (CACHE_VERSION, IMAGE_BASE_URL) else {}
+
+def save_cache(cache):
+    with open(CACHE_FILE, 'wb') as f:
+        pickle.dump(((CACHE_VERSION, IMAGE_BASE_URL), cache), f, protocol=pickle.HIGHEST_PROTOCOL)
+
 def format_date(date_str):
     # Expect "2021. 7. 19. 23:31" or similar
     try:
@@ -98,60 +134,83 @@ def format_date(date_str):
         # Try simplified if seconds missing or different format
         return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-def create_item(post):
-    title = escape(post['title'])
-    content = escape(post['content_html'])
-    post_id = post['post_id']
+def write_item(xf, post):
+    post_id = str(post['post_id'])
     date_str = format_date(post['date'])
-    category = escape(post['category'])
+    category = post['category']
     
     # Publii uses <content:encoded>, <wp:post_date>, <title>, <wp:status>publish</wp:status>
     # <wp:post_type>post</wp:post_type>
     
-    return f"""
-	<item>
-		<title>{title}</title>
-		<link>{post['original_url']}</link>
-		<pubDate>{date_str}</pubDate>
-		<dc:creator><![CDATA[admin]]></dc:creator>
-		<guid isPermaLink="false">http://localhost/?p={post_id}</guid>
-		<description></description>
-		<content:encoded><![CDATA[{post['content_html']}]]></content:encoded>
-		<excerpt:encoded><![CDATA[]]></excerpt:encoded>
-		<wp:post_id>{post_id}</wp:post_id>
-		<wp:post_date>{date_str}</wp:post_date>
-		<wp:post_date_gmt>{date_str}</wp:post_date_gmt>
-		<wp:comment_status>open</wp:comment_status>
-		<wp:ping_status>open</wp:ping_status>
-		<wp:post_name>post-{post_id}</wp:post_name>
-		<wp:status>publish</wp:status>
-		<wp:post_parent>0</wp:post_parent>
-		<wp:menu_order>0</wp:menu_order>
-		<wp:post_type>post</wp:post_type>
-		<wp:post_password></wp:post_password>
-		<wp:is_sticky>0</wp:is_sticky>
-		<category domain="category" nicename="{category}"><![CDATA[{category}]]></category>
-	</item>
-"""
+    with xf.element('item'):
+        xf.write('\n')
+        write_element(xf, 'title', post['title'])
+        write_element(xf, 'link', post['original_url'])
+        write_element(xf, 'pubDate', date_str)
+        write_element(xf, 'dc:creator', 'admin', cdata=True)
+        write_element(xf, 'guid', f"http://localhost/?p={post_id}", attrib={'isPermaLink': 'false'})
+        write_element(xf, 'description')
+        write_element(xf, 'content:encoded', post['content_html'], cdata=True)
+        write_element(xf, 'excerpt:encoded', '', cdata=True)
+        write_element(xf, 'wp:post_id', post_id)
+        write_element(xf, 'wp:post_date', date_str)
+        write_element(xf, 'wp:post_date_gmt', date_str)
+        write_element(xf, 'wp:comment_status', 'open')
+        write_element(xf, 'wp:ping_status', 'open')
+        write_element(xf, 'wp:post_name', f"post-{post_id}")
+        write_element(xf, 'wp:status', 'publish')
+        write_element(xf, 'wp:post_parent', '0')
+        write_element(xf, 'wp:menu_order', '0')
+        write_element(xf, 'wp:post_type', 'post')
+        write_element(xf, 'wp:post_password')
+        write_element(xf, 'wp:is_sticky', '0')
+        write_element(xf, 'category', category, cdata=True, attrib={'domain': 'category', 'nicename': category})
+    xf.write('\n')
 
 def main():
     print("Starting conversion...")
     
-    # Read files
-    files = glob.glob(os.path.join(BACKUP_DIR, "*.md"))
-    files.sort(key=lambda x: int(os.path.basename(x).split('.')[0]))
+    # Read files; posts are ordered by their id once parsed
+    files = list(iter_md(BACKUP_DIR))
     
-    print(f"Found {len(files)} files.")
+    # Reuse parsed posts whose file is unchanged since the last run
+    cache = load_cache()
+    posts = {}
+    stale = []
+    for f in files:
+        st = os.stat(f)
+        entry = cache.get(f)
+        if entry and entry[0] == st.st_mtime and entry[1] == st.st_size:
+            posts[f] = entry[2]
+        else:
+            stale.append((f, st))
+
+    print(f"Found {len(files)} files ({len(files) - len(stale)} cached).")
+
+    # Markdown rendering is CPU-bound, so parse the rest across processes;
+    # chunks of 16 files amortize the pickling overhead per task
+    if stale:
+        with ProcessPoolExecutor() as pool:
+            parsed = pool.map(parse_markdown_file, [f for f, _ in stale], chunksize=16)
+            for (f, st), post in zip(stale, parsed):
+                posts[f] = post
+                cache[f] = (st.st_mtime, st.st_size, post)
+        save_cache({f: cache[f] for f in files})
+
+    ordered = sorted((post for post in posts.values() if post), key=lambda p: int(p['post_id']))
     
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as outfile:
-        outfile.write(create_wxr_header())
-        
-        for f in files:
-            post = parse_markdown_file(f)
-            if post:
-                outfile.write(create_item(post))
+    # lxml serializes and escapes the XML incrementally as items are written
+    with xmlfile(OUTPUT_FILE, encoding='utf-8') as xf:
+        xf.write_declaration()
+        with xf.element('rss', nsmap=NSMAP, version='2.0'):
+            xf.write('\n')
+            with xf.element('channel'):
+                xf.write('\n')
+                write_wxr_header(xf)
                 
-        outfile.write(create_wxr_footer())
+                for post in ordered:
+                    write_item(xf, post)
+            xf.write('\n')
         
     print(f"Conversion complete. Saved to {OUTPUT_FILE}")
 
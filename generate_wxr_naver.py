@@ -1,21 +1,48 @@
 import os
-import glob
-import markdown
-import yaml
+import mistune
 import re
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
 from datetime import datetime
-from xml.sax.saxutils import escape
+from lxml.etree import xmlfile, CDATA
 
 # Configuration
 POSTS_DIR = 'backup_naver/posts'
 IMAGES_BASE_URL = 'https://kyunghyuncho.github.io/baekyu-seock-blog/backup_naver/images/'
 OUTPUT_FILE = 'wordpress_import_naver.xml'
+CACHE_FILE = '.wxr_cache_naver.pkl'
+CACHE_VERSION = 3 # Bump when parse_markdown_file output changes
+
+# Markdown renderer; escape=False keeps raw HTML from the backups intact
+_MD = mistune.create_markdown(escape=False, plugins=['table', 'strikethrough', 'url'])
+
+# Precompiled patterns used per post
+_WS_RE = re.compile(r'\s+')
+# Markdown image syntax ![alt](path); negated classes instead of lazy .*? avoid backtracking
+_MD_IMG_RE = re.compile(r'!\[([^\]\n]*)\]\(([^)\n]*)\)')
+_IMG_TAG_RE = re.compile(r'<img\s+')
+_FRONTMATTER_RE = re.compile(rb'^---$', re.MULTILINE)
+# Frontmatter "key: value" lines; outer "..." or '...' around the value is dropped
+_FM_RE = re.compile(rb'''^[ \t]*(title|date|category|id|url)[ \t]*:[ \t]*(?:"(.*)"|'(.*)'|(.*?))[ \t]*$''', re.MULTILINE)
+
+# Characters XML 1.0 forbids (e.g. \x0b pasted from Word); lxml refuses to write them
+_XML_INVALID_RE = re.compile('[^\t\n\r\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]')
+
+# WXR namespaces, declared once on <rss>
+NSMAP = {
+    'excerpt': "http://wordpress.org/export/1.2/excerpt/",
+    'content': "http://purl.org/rss/1.0/modules/content/",
+    'wfw': "http://wellformedweb.org/CommentAPI/",
+    'dc': "http://purl.org/dc/elements/1.1/",
+    'wp': "http://wordpress.org/export/1.2/",
+}
 
 def parse_date(date_str):
     """Parses date string like '2007. 4. 10. 11:32' to 'YYYY-MM-DD HH:MM:SS'."""
     try:
         # Normalize spaces
-        date_str = re.sub(r'\s+', ' ', date_str).strip()
+        date_str = _WS_RE.sub(' ', date_str).strip()
         # Naver sometimes has just date "2026. 1. 19."
         if len(date_str.split('.')) == 4: # e.g. "2026. 1. 19."
              dt = datetime.strptime(date_str, '%Y. %m. %d.')
@@ -75,124 +102,195 @@ def process_markdown_content(md_content, post_id):
         return match.group(0)
 
     # Replace standard markdown image syntax
-    content = re.sub(r'!\[(.*?)\]\((.*?)\)', image_replacer, md_content)
+    content = _MD_IMG_RE.sub(image_replacer, md_content)
     
-    # Using markdown library to convert to HTML
-    html = markdown.markdown(content, extensions=['tables', 'fenced_code'])
+    # Using mistune to convert to HTML
+    html = _MD(content)
     
     # Add responsive styling to all img tags
     # Regex replace <img ... > with <img ... style="max-width: 100%; height: auto;">
     # avoiding duplicate style attributes if possible, but simple injection is safer for generated content
-    html = re.sub(r'<img\s+', '<img style="max-width: 100%; height: auto;" ', html)
+    html = _IMG_TAG_RE.sub('<img style="max-width: 100%; height: auto;" ', html)
     
     return html
 
+def parse_markdown_file(file_path):
+    """Parses a backed-up post into the fields needed for its WXR item, or None."""
+    with open(file_path, 'rb') as f:
+        # Backups written in text mode on Windows have CRLF line endings
+        content = f.read().replace(b'\r\n', b'\n')
+        
+    # Parse Frontmatter
+    try:
+        # Split by first two ---
+        parts = _FRONTMATTER_RE.split(content, maxsplit=2)
+        if len(parts) < 3:
+            print(f"Skipping {file_path}: Invalid frontmatter format")
+            return None
+
+        frontmatter_raw = parts[1]
+        markdown_body = parts[2].decode('utf-8')
+
+        # One regex sweep handles quoted and unquoted values alike, including
+        # titles with unescaped quotes that YAML rejects
+        metadata = {m[1].decode(): m[m.lastindex].decode('utf-8') for m in _FM_RE.finditer(frontmatter_raw)}
+
+        post_id = metadata.get('id', 0)
+        title = metadata.get('title', 'Untitled')
+        date_str = metadata.get('date', '')
+        category = metadata.get('category', 'Uncategorized')
+        original_url = metadata.get('url', '')
+
+        formatted_date = parse_date(str(date_str))
+        html_content = process_markdown_content(markdown_body, post_id)
+
+        return {
+            "post_id": post_id,
+            "title": title,
+            "category": category,
+            "original_url": original_url,
+            "formatted_date": formatted_date,
+            "html_content": html_content
+        }
+
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+        return None
+
+def iter_md(directory):
+    """Yields (path, post id) for each <id>.md file, using scandir's cached entry type."""
+    with os.scandir(directory) as it:
+        for entry in it:
+            # Skip non-post files such as a README or drafts
+            if entry.name.endswith('.md') and entry.name[:-3].isdecimal() and entry.is_file():
+                yield entry.path, int(entry.name[:-3])
+
+def load_cache():
+    """Loads {file_path: (mtime, size, post)} from CACHE_FILE, or {} if unusable."""
+    try:
+        with open(CACHE_FILE, 'rb') as f:
+            stamp, cache = pickle.load(f)
+    except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return {}
+    # Cached HTML has IMAGES_BASE_URL baked in, so a config change invalidates it too
+    return cache if stamp == (CACHE_VERSION, IMAGES_BASE_URL) else {}
+
+def save_cache(cache):
+    with open(CACHE_FILE, 'wb') as f:
+        pickle.dump(((CACHE_VERSION, IMAGES_BASE_URL), cache), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def qname(tag):
+    """Expands a prefixed name like 'wp:post_id' to lxml's '{uri}post_id' form."""
+    prefix, sep, local = tag.partition(':')
+    return f"{{{NSMAP[prefix]}}}{local}" if sep else tag
+
+def write_element(xf, tag, text='', cdata=False, attrib=None):
+    """Writes a leaf element; lxml escapes the text, or it is wrapped in CDATA."""
+    text = _XML_INVALID_RE.sub('', text)
+    if attrib:
+        attrib = {k: _XML_INVALID_RE.sub('', v) for k, v in attrib.items()}
+    with xf.element(qname(tag), attrib):
+        if cdata and ']]>' not in text:
+            xf.write(CDATA(text))
+        elif text:
+            xf.write(text)
+    xf.write('\n')
+
+def write_wxr_header(xf):
+    write_element(xf, 'title', 'Baekyu Seock Blog Backup (Naver)')
+    write_element(xf, 'link', 'https://kyunghyuncho.github.io/baekyu-seock-blog/')
+    write_element(xf, 'description', 'Backup of Naver Blog')
+    write_element(xf, 'pubDate', 'Tue, 21 Jan 2026 00:00:00 +0000')
+    write_element(xf, 'language', 'ko-KR')
+    write_element(xf, 'wp:wxr_version', '1.2')
+    write_element(xf, 'wp:base_site_url', 'https://kyunghyuncho.github.io/baekyu-seock-blog/')
+    write_element(xf, 'wp:base_blog_url', 'https://kyunghyuncho.github.io/baekyu-seock-blog/')
+    with xf.element(qname('wp:author')):
+        write_element(xf, 'wp:author_id', '1')
+        write_element(xf, 'wp:author_login', 'admin')
+        write_element(xf, 'wp:author_email', 'admin@example.com')
+        write_element(xf, 'wp:author_display_name', 'admin', cdata=True)
+        write_element(xf, 'wp:author_first_name', '', cdata=True)
+        write_element(xf, 'wp:author_last_name', '', cdata=True)
+    xf.write('\n')
+
+def write_item(xf, post):
+    post_id = str(post['post_id'])
+    category = str(post['category'])
+    original_url = post['original_url']
+    formatted_date = post['formatted_date']
+
+    with xf.element('item'):
+        xf.write('\n')
+        write_element(xf, 'title', str(post['title']))
+        write_element(xf, 'link', original_url)
+        write_element(xf, 'pubDate', formatted_date)
+        write_element(xf, 'dc:creator', 'admin', cdata=True)
+        write_element(xf, 'guid', original_url, attrib={'isPermaLink': 'false'})
+        write_element(xf, 'description')
+        write_element(xf, 'content:encoded', post['html_content'], cdata=True)
+        write_element(xf, 'excerpt:encoded', '', cdata=True)
+        write_element(xf, 'wp:post_id', post_id)
+        write_element(xf, 'wp:post_date', formatted_date)
+        write_element(xf, 'wp:post_date_gmt', formatted_date)
+        write_element(xf, 'wp:comment_status', 'open')
+        write_element(xf, 'wp:ping_status', 'open')
+        write_element(xf, 'wp:post_name', f"post-{post_id}")
+        write_element(xf, 'wp:status', 'publish')
+        write_element(xf, 'wp:post_parent', '0')
+        write_element(xf, 'wp:menu_order', '0')
+        write_element(xf, 'wp:post_type', 'post')
+        write_element(xf, 'wp:post_password')
+        write_element(xf, 'wp:is_sticky', '0')
+        write_element(xf, 'category', category, cdata=True, attrib={'domain': 'category', 'nicename': category})
+    xf.write('\n')
+
 def generate_xml():
-    xml_header = """<?xml version="1.0" encoding="UTF-8" ?>
-<rss version="2.0"
-	xmlns:excerpt="http://wordpress.org/export/1.2/excerpt/"
-	xmlns:content="http://purl.org/rss/1.0/modules/content/"
-	xmlns:wfw="http://wellformedweb.org/CommentAPI/"
-	xmlns:dc="http://purl.org/dc/elements/1.1/"
-	xmlns:wp="http://wordpress.org/export/1.2/"
->
-<channel>
-	<title>Baekyu Seock Blog Backup (Naver)</title>
-	<link>https://kyunghyuncho.github.io/baekyu-seock-blog/</link>
-	<description>Backup of Naver Blog</description>
-	<pubDate>Tue, 21 Jan 2026 00:00:00 +0000</pubDate>
-	<language>ko-KR</language>
-	<wp:wxr_version>1.2</wp:wxr_version>
-	<wp:base_site_url>https://kyunghyuncho.github.io/baekyu-seock-blog/</wp:base_site_url>
-	<wp:base_blog_url>https://kyunghyuncho.github.io/baekyu-seock-blog/</wp:base_blog_url>
-    <wp:author><wp:author_id>1</wp:author_id><wp:author_login>admin</wp:author_login><wp:author_email>admin@example.com</wp:author_email><wp:author_display_name><![CDATA[admin]]></wp:author_display_name><wp:author_first_name><![CDATA[]]></wp:author_first_name><wp:author_last_name><![CDATA[]]></wp:author_last_name></wp:author>
-"""
-    
-    xml_footer = """
-</channel>
-</rss>
-"""
-    
-    items_xml = []
-    
     if not os.path.exists(POSTS_DIR):
         print(f"Error: Posts directory {POSTS_DIR} does not exist.")
         return
 
-    md_files = glob.glob(os.path.join(POSTS_DIR, '*.md'))
-    print(f"Found {len(md_files)} posts.")
-    
+    md_files = [path for path, _ in sorted(iter_md(POSTS_DIR), key=itemgetter(1))]
+
+    # Reuse parsed posts whose file is unchanged since the last run
+    cache = load_cache()
+    posts = {}
+    stale = []
     for file_path in md_files:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-            
-        # Parse Frontmatter
-        try:
-            # Split by first two ---
-            parts = re.split(r'^---$', content, maxsplit=2, flags=re.MULTILINE)
-            if len(parts) < 3:
-                print(f"Skipping {file_path}: Invalid frontmatter format")
-                continue
+        st = os.stat(file_path)
+        entry = cache.get(file_path)
+        if entry and entry[0] == st.st_mtime and entry[1] == st.st_size:
+            posts[file_path] = entry[2]
+        else:
+            stale.append((file_path, st))
+
+    print(f"Found {len(md_files)} posts ({len(md_files) - len(stale)} cached).")
+
+    # Markdown rendering is CPU-bound, so parse the rest across processes
+    if stale:
+        with ProcessPoolExecutor() as pool:
+            parsed = pool.map(parse_markdown_file, [file_path for file_path, _ in stale])
+            for (file_path, st), post in zip(stale, parsed):
+                posts[file_path] = post
+                cache[file_path] = (st.st_mtime, st.st_size, post)
+        save_cache({file_path: cache[file_path] for file_path in md_files})
+    del cache
+    
+    # Stream items straight to the file and drop each post once written, so
+    # the whole XML document is never held in memory; lxml does the escaping
+    with xmlfile(OUTPUT_FILE, encoding='utf-8') as xf:
+        xf.write_declaration()
+        with xf.element('rss', nsmap=NSMAP, version='2.0'):
+            xf.write('\n')
+            with xf.element('channel'):
+                xf.write('\n')
+                write_wxr_header(xf)
                 
-            frontmatter_raw = parts[1]
-            markdown_body = parts[2]
-            
-            try:
-                metadata = yaml.safe_load(frontmatter_raw)
-            except yaml.YAMLError:
-                # Fallback manual parsing for titles with unescaped quotes
-                metadata = {}
-                for line in frontmatter_raw.splitlines():
-                    if ':' in line:
-                        key, value = line.split(':', 1)
-                        key = key.strip()
-                        value = value.strip()
-                        # Remove outer quotes if present
-                        if (value.startswith('"') and value.endswith('"')) or (value.startswith("'") and value.endswith("'")):
-                            value = value[1:-1]
-                        metadata[key] = value
-            
-            post_id = metadata.get('id', 0)
-            title = metadata.get('title', 'Untitled')
-            date_str = metadata.get('date', '')
-            category = metadata.get('category', 'Uncategorized')
-            original_url = metadata.get('url', '')
-            
-            formatted_date = parse_date(str(date_str))
-            html_content = process_markdown_content(markdown_body, post_id)
-            
-            item = f"""
-	<item>
-		<title>{escape(str(title))}</title>
-		<link>{original_url}</link>
-		<pubDate>{formatted_date}</pubDate>
-		<dc:creator><![CDATA[admin]]></dc:creator>
-		<guid isPermaLink="false">{original_url}</guid>
-		<description></description>
-		<content:encoded><![CDATA[{html_content}]]></content:encoded>
-		<excerpt:encoded><![CDATA[]]></excerpt:encoded>
-		<wp:post_id>{post_id}</wp:post_id>
-		<wp:post_date>{formatted_date}</wp:post_date>
-		<wp:post_date_gmt>{formatted_date}</wp:post_date_gmt>
-		<wp:comment_status>open</wp:comment_status>
-		<wp:ping_status>open</wp:ping_status>
-		<wp:post_name>post-{post_id}</wp:post_name>
-		<wp:status>publish</wp:status>
-		<wp:post_parent>0</wp:post_parent>
-		<wp:menu_order>0</wp:menu_order>
-		<wp:post_type>post</wp:post_type>
-		<wp:post_password></wp:post_password>
-		<wp:is_sticky>0</wp:is_sticky>
-		<category domain="category" nicename="{escape(category)}"><![CDATA[{escape(category)}]]></category>
-	</item>
-"""
-            items_xml.append(item)
-            
-        except Exception as e:
-            print(f"Error processing {file_path}: {e}")
-            
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        f.write(xml_header + "".join(items_xml) + xml_footer)
+                for file_path in md_files:
+                    post = posts.pop(file_path)
+                    if post:
+                        write_item(xf, post)
+            xf.write('\n')
         
     print(f"Successfully generated {OUTPUT_FILE}")
 